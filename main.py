@@ -1,3 +1,5 @@
+from concurrent.futures import ProcessPoolExecutor
+
 from src.data.data_loader import load_hillstrom, prepare_treatment
 from src.features.eda import check_randomization
 from src.models.ab_test import ab_test_proportion, ab_test_spend
@@ -9,26 +11,40 @@ from src.models.uplift_model import (
 )
 from src.models.roi import simulate_roi
 
-def run_ab_tests(df):
+def run_ab_tests(df, method="normal"):
+    parts = {seg: sub for seg, sub in df.groupby("segment", sort=False, observed=True)}
+
     def counts(a, b):
-        sub = df[df["segment"].isin([a, b])]
-        tab = sub.groupby("segment")["conversion"].agg(["sum", "count"])
-        return tab.loc[a, "sum"], tab.loc[a, "count"], tab.loc[b, "sum"], tab.loc[b, "count"]
+        xa, xb = parts[a]["conversion"], parts[b]["conversion"]
+        return xa.sum(), len(xa), xb.sum(), len(xb)
 
     pairs = [("Mens E-Mail", "No E-Mail"),
              ("Womens E-Mail", "No E-Mail"),
              ("Mens E-Mail", "Womens E-Mail")]
 
+    spend_pairs = [("Mens E-Mail", "No E-Mail"), ("Womens E-Mail", "No E-Mail")]
+
     for a, b in pairs:
         x_s, x_n, y_s, y_n = counts(a, b)
         print(f"\nConversion: {a} vs {b}")
         print(ab_test_proportion(x_s, x_n, y_s, y_n))
 
-    for a, b in [("Mens E-Mail", "No E-Mail"), ("Womens E-Mail", "No E-Mail")]:
-        xa = df[df["segment"] == a]["spend"].to_numpy()
-        xb = df[df["segment"] == b]["spend"].to_numpy()
+    spend_args = [(parts[a]["spend"].to_numpy(), parts[b]["spend"].to_numpy()) for a, b in spend_pairs]
+    spend_results = _run_spend_tests(spend_args, method)
+
+    for (a, b), res in zip(spend_pairs, spend_results):
         print(f"\nSpend: {a} vs {b}")
-        print(ab_test_spend(xa, xb))
+        print(res)
+
+
+def _run_spend_tests(spend_args, method):
+    """Only the bootstrap is heavy enough to pay for worker processes."""
+    if method != "bootstrap":
+        return [ab_test_spend(x, y, method=method) for x, y in spend_args]
+
+    with ProcessPoolExecutor(max_workers=len(spend_args)) as ex:
+        futs = [ex.submit(ab_test_spend, x, y, method=method) for x, y in spend_args]
+        return [fut.result() for fut in futs]
 
 
 def run_uplift(df, treat, control):
@@ -39,7 +55,7 @@ def run_uplift(df, treat, control):
     res = train_uplift_tlearner(sub, features)
 
     phi, qini = qini_curve(res["y_true"], res["uplift_pred"], res["treatment"])
-    auc = qini_auc(phi, qini, res["treatment"], res["y_true"])
+    auc = qini_auc(phi, qini)
     print(f"\nQini AUC ({treat} vs {control}):", auc)
 
     img_path = f"figures/qini_{treat.replace(' ','_').lower()}_vs_{control.replace(' ','_').lower()}.png"
@@ -2,19 +2,33 @@
 Run A/B tests for Hillstrom Email Experiment.
 This script performs:
 - Conversion z-tests
-- Spend t-test + bootstrap CI
+- Spend t-test + 95% CI (normal or bootstrap)
 """
 
+from concurrent.futures import ProcessPoolExecutor
+
 from src.data.data_loader import load_hillstrom
 from src.models.ab_test import ab_test_proportion, ab_test_spend
 
 
-def run_ab_tests(df):
-    """Run all A/B tests."""
+def _run_spend_tests(spend_args, method):
+    """Run spend tests; only the bootstrap is heavy enough for worker processes."""
+    if method != "bootstrap":
+        return [ab_test_spend(x, y, method=method) for x, y in spend_args]
+
+    with ProcessPoolExecutor(max_workers=len(spend_args)) as ex:
+        futs = [ex.submit(ab_test_spend, x, y, method=method) for x, y in spend_args]
+        return [fut.result() for fut in futs]
+
+
+def run_ab_tests(df, method="normal"):
+    """Run all A/B tests (`method` selects the spend CI: "normal" or "bootstrap")."""
+    # Partition once (segments are disjoint); every test below reuses the parts
+    parts = {seg: sub for seg, sub in df.groupby("segment", sort=False, observed=True)}
+
     def counts(a, b):
-        sub = df[df["segment"].isin([a, b])]
-        tab = sub.groupby("segment")["conversion"].agg(["sum", "count"])
-        return tab.loc[a, "sum"], tab.loc[a, "count"], tab.loc[b, "sum"], tab.loc[b, "count"]
+        xa, xb = parts[a]["conversion"], parts[b]["conversion"]
+        return xa.sum(), len(xa), xb.sum(), len(xb)
 
     pairs = [
         ("Mens E-Mail", "No E-Mail"),
@@ -22,6 +36,11 @@ def run_ab_tests(df):
         ("Mens E-Mail", "Womens E-Mail"),
     ]
 
+    spend_pairs = [
+        ("Mens E-Mail", "No E-Mail"),
+        ("Womens E-Mail", "No E-Mail")
+    ]
+
     print("\n========================")
     print("A/B TESTING - CONVERSION")
     print("========================")
@@ -35,14 +54,13 @@ def run_ab_tests(df):
     print("A/B TESTING - SPEND")
     print("====================")
 
-    for a, b in [
-        ("Mens E-Mail", "No E-Mail"),
-        ("Womens E-Mail", "No E-Mail")
-    ]:
-        x_vals = df[df["segment"] == a]["spend"].to_numpy()
-        y_vals = df[df["segment"] == b]["spend"].to_numpy()
+    spend_args = [
+        (parts[a]["spend"].to_numpy(), parts[b]["spend"].to_numpy())
+        for a, b in spend_pairs
+    ]
+    for (a, b), res in zip(spend_pairs, _run_spend_tests(spend_args, method)):
         print(f"\n{a} vs {b}")
-        print(ab_test_spend(x_vals, y_vals))
+        print(res)
 
 
 if __name__ == "__main__":
@@ -3,10 +3,44 @@
 available); otherwise downloads a CSV from a public GitHub mirror"""
 
 # Works with fetch_hillstorm
+import os
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
-def load_hillstrom() -> pd.DataFrame:
-    """Load Hillstrom dataset (from scikit-uplift or fallback CSV)."""
+# Bump the file name whenever the cached schema/dtypes change
+CACHE_PATH = Path.home() / ".cache" / "hillstrom" / "v2.parquet"
+
+
+def load_hillstrom(use_cache: bool = True) -> pd.DataFrame:
+    """Load Hillstrom dataset (from local Parquet cache, scikit-uplift or fallback CSV)."""
+    if use_cache and CACHE_PATH.exists():
+        try:
+            return pd.read_parquet(CACHE_PATH)
+        except Exception:
+            # Corrupt/unreadable cache: drop it and fetch again
+            CACHE_PATH.unlink(missing_ok=True)
+
+    df = _fetch_hillstrom()
+
+    if use_cache:
+        tmp_path = CACHE_PATH.with_name(f"{CACHE_PATH.name}.{os.getpid()}.tmp")
+        try:
+            CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(tmp_path, compression="zstd")
+            # Atomic rename: readers never see a partially written cache
+            os.replace(tmp_path, CACHE_PATH)
+        except Exception:
+            # Cache is best-effort (e.g. no Parquet engine, read-only home)
+            pass
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return df
+
+
+def _fetch_hillstrom() -> pd.DataFrame:
+    """Download Hillstrom dataset and normalize columns/dtypes."""
     try:
         from sklift.datasets import fetch_hillstrom
         data = fetch_hillstrom(target_col="all", return_X_y_t=False)
@@ -17,7 +51,8 @@ def load_hillstrom() -> pd.DataFrame:
             "https://www.minethatdata.com/"
             "Kevin_Hillstrom_MineThatData_E-MailAnalytics_DataMiningChallenge_2008.03.20.csv"
         )
-        df = pd.read_csv(url)
+        # Multi-threaded Arrow parser; keep NumPy dtypes for downstream code
+        df = pd.read_csv(url, engine="pyarrow")
         df.columns = [c.lower() for c in df.columns]
     
     # Check lacking of schema
@@ -26,13 +61,21 @@ def load_hillstrom() -> pd.DataFrame:
     if missing:
         raise ValueError(f"Lacking: {missing}. Use sklift.fetch_hillstrom(target_col='all').")
     
-    df["conversion"] = df["conversion"].astype(int)
-    df["visit"] = df["visit"].astype(int)
+    # Few distinct labels: categorical codes make grouping/filtering cheap
+    df["segment"] = df["segment"].astype("category")
+    # Binary flags and spend do not need 64-bit storage
+    df["conversion"] = df["conversion"].astype(np.int8)
+    df["visit"] = df["visit"].astype(np.int8)
+    df["spend"] = df["spend"].astype(np.float32)
     return df
 
 
 def prepare_treatment(df: pd.DataFrame, treat: str, control: str) -> pd.DataFrame:
     """Prepare dataset for 2-arm uplift training."""
-    sub = df[df["segment"].isin([treat, control])].copy()
-    sub["treatment"] = (sub["segment"] == treat).astype(int)
+    seg = df["segment"].astype("category")  # no-op if already categorical
+    codes = seg.cat.codes.to_numpy()
+    is_treat = codes == seg.cat.categories.get_loc(treat)
+    mask = is_treat | (codes == seg.cat.categories.get_loc(control))
+
+    sub = df.loc[mask].assign(treatment=is_treat[mask].astype(np.int8))
     return sub.reset_index(drop=True)
@@ -1,10 +1,10 @@
 import pandas as pd
 
 def check_randomization(df: pd.DataFrame, baseline_cols: list) -> pd.DataFrame:
+    g = df.groupby("segment", observed=True)[baseline_cols]
     return (
-        df.groupby("segment")[baseline_cols]
-        .agg(["mean", "std"])
-        .stack(future_stack=True)
+        pd.concat({"mean": g.mean(), "std": g.std()}, names=["variable"])
+        .swaplevel()
+        .sort_index(level="segment", sort_remaining=False, kind="stable")
         .reset_index()
-        .rename(columns={"level_1": "variable"})
     )
\ No newline at end of file
@@ -1,13 +1,31 @@
+import math
+
 import numpy as np
 from scipy import stats
-from statsmodels.stats.proportion import proportions_ztest
+
+# Numba is optional: only needed for backend="numba"
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# CuPy is optional: only needed for backend="cupy"
+try:
+    import cupy as cp
+    HAS_CUPY = True
+except ImportError:
+    HAS_CUPY = False
 
 def ab_test_proportion(x_success, x_total, y_success, y_total):
-    count = np.array([x_success, y_success])
-    nobs = np.array([x_total, y_total])
-    z_stat, p_val = proportions_ztest(count, nobs)
+    rate_x, rate_y = x_success / x_total, y_success / y_total
+
+    # Pooled two-proportion z-test (same as statsmodels' proportions_ztest)
+    p_pool = (x_success + y_success) / (x_total + y_total)
+    se = math.sqrt(p_pool * (1 - p_pool) * (1 / x_total + 1 / y_total))
+    z_stat = (rate_x - rate_y) / se if se > 0 else np.nan
+    p_val = 2 * stats.norm.sf(abs(z_stat))
 
-    rate_x, rate_y = count[0]/nobs[0], count[1]/nobs[1]
     abs_lift = rate_x - rate_y
     rel_lift = abs_lift / rate_y if rate_y > 0 else np.nan
 
@@ -21,24 +39,117 @@ def ab_test_proportion(x_success, x_total, y_success, y_total):
     }
 
 
-def ab_test_spend(x_vals, y_vals, n_boot=5000, seed=42):
-    x_vals, y_vals = np.asarray(x_vals), np.asarray(y_vals)
-    x_vals, y_vals = x_vals[~np.isnan(x_vals)], y_vals[~np.isnan(y_vals)]
+def _drop_nan(vals):
+    """Return a contiguous float64 array without NaNs, copying only if needed."""
+    vals = np.ascontiguousarray(vals, dtype=np.float64)
+    # A single reduction detects NaN without allocating a mask
+    if np.isnan(vals.sum()):
+        vals = vals[~np.isnan(vals)]
+    return vals
+
+
+def _boot_means(vals, n_boot, rng, batch=512):
+    """Bootstrap sample means via multinomial resampling weights.
+
+    Zeros add nothing to a resampled sum, so they share one bucket and only
+    the non-zero values enter the weight matrix (spend is mostly zeros).
+    Weights are drawn `batch` resamples at a time to bound peak memory.
+    """
+    n = len(vals)
+    nz = vals[vals != 0]
+    pvals = np.full(len(nz) + 1, 1.0 / n)
+    pvals[-1] = (n - len(nz)) / n
+
+    means = np.empty(n_boot)
+    for start in range(0, n_boot, batch):
+        end = min(start + batch, n_boot)
+        w = rng.multinomial(n, pvals, size=end - start)
+        means[start:end] = w[:, :-1] @ nz / n
+    return means
+
+
+def _percentile_ci(diffs, alpha=0.05):
+    """Two-sided percentile CI from a single partition (interpolated like np.percentile)."""
+    pos = np.array([alpha / 2, 1 - alpha / 2]) * (len(diffs) - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, len(diffs) - 1)
+    part = np.partition(diffs, np.union1d(lo, hi))
+    return part[lo] + (pos - lo) * (part[hi] - part[lo])
+
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True)
+    def _boot_mean_diff_numba(x, y, seeds):
+        """Bootstrap mean differences without materializing the resamples.
+
+        Resample b reseeds the worker thread's RNG with seeds[b] before
+        drawing, so results depend only on `seeds`, not on thread count or
+        scheduling. Suited to dense inputs; for mostly-zero data the
+        multinomial `_boot_means` path is much faster.
+        """
+        n_boot = len(seeds)
+        n_x, n_y = len(x), len(y)
+        diffs = np.empty(n_boot)
+        for b in prange(n_boot):
+            np.random.seed(seeds[b])
+            sum_x = 0.0
+            for _ in range(n_x):
+                sum_x += x[np.random.randint(0, n_x)]
+            sum_y = 0.0
+            for _ in range(n_y):
+                sum_y += y[np.random.randint(0, n_y)]
+            diffs[b] = sum_x / n_x - sum_y / n_y
+        return diffs
+
+
+def _boot_mean_diff_cupy(x_vals, y_vals, n_boot, seed, batch=512):
+    """Batched index bootstrap of mean differences on the GPU."""
+    x, y = cp.asarray(x_vals), cp.asarray(y_vals)
+    rs = cp.random.RandomState(seed)
+    diffs = cp.empty(n_boot)
+    for start in range(0, n_boot, batch):
+        end = min(start + batch, n_boot)
+        ix = rs.randint(0, len(x), size=(end - start, len(x)))
+        iy = rs.randint(0, len(y), size=(end - start, len(y)))
+        diffs[start:end] = x[ix].mean(axis=1) - y[iy].mean(axis=1)
+    return diffs.get()
+
+
+def ab_test_spend(x_vals, y_vals, n_boot=5000, seed=42, method="normal", batch=512, backend="numpy"):
+    if backend not in ("numpy", "numba", "cupy"):
+        raise ValueError(f"Unknown backend: {backend!r}. Use 'numpy', 'numba' or 'cupy'.")
+    if backend == "numba" and not HAS_NUMBA:
+        raise ImportError("backend='numba' requires Numba to be installed.")
+    if backend == "cupy" and not HAS_CUPY:
+        raise ImportError("backend='cupy' requires CuPy to be installed.")
+
+    x_vals, y_vals = _drop_nan(x_vals), _drop_nan(y_vals)
 
     t_stat, p_val = stats.ttest_ind(x_vals, y_vals, equal_var=False)
+    mean_diff = x_vals.mean() - y_vals.mean()
 
-    rng = np.random.default_rng(seed)
-    diffs = []
-    for _ in range(n_boot):
-        sx = rng.choice(x_vals, size=len(x_vals), replace=True)
-        sy = rng.choice(y_vals, size=len(y_vals), replace=True)
-        diffs.append(sx.mean() - sy.mean())
-    lower, upper = np.percentile(diffs, [2.5, 97.5])
+    if method == "normal":
+        # CLT limit of the bootstrap CI for a mean difference (Welch SE)
+        se = np.sqrt(x_vals.var(ddof=1) / len(x_vals) + y_vals.var(ddof=1) / len(y_vals))
+        lower, upper = mean_diff - 1.96 * se, mean_diff + 1.96 * se
+    elif method == "bootstrap":
+        # Counter-based Philox: fast bulk draws and jumpable disjoint streams
+        rng = np.random.Generator(np.random.Philox(seed))
+        if backend == "cupy":
+            diffs = _boot_mean_diff_cupy(x_vals, y_vals, n_boot, seed, batch)
+        elif backend == "numba":
+            seeds = rng.integers(0, 2**32 - 1, size=n_boot, dtype=np.uint32)
+            diffs = _boot_mean_diff_numba(x_vals, y_vals, seeds)
+        else:
+            diffs = _boot_means(x_vals, n_boot, rng, batch) - _boot_means(y_vals, n_boot, rng, batch)
+        lower, upper = _percentile_ci(diffs)
+    else:
+        raise ValueError(f"Unknown method: {method!r}. Use 'normal' or 'bootstrap'.")
 
     return {
         "t_stat": t_stat,
         "p_value": p_val,
-        "mean_diff": x_vals.mean() - y_vals.mean(),
+        "mean_diff": mean_diff,
         "ci_lower": lower,
         "ci_upper": upper,
     }
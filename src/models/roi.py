@@ -19,10 +19,10 @@ import pandas as pd
 
 # Try relative import first (when used as part of package)
 try:
-    from .uplift_model import uplift_at_k
+    from .uplift_model import sorted_cumsums, uplift_at_k_from_cumsums
 except Exception:
     # Fallback for standalone execution
-    from uplift_model import uplift_at_k
+    from uplift_model import sorted_cumsums, uplift_at_k_from_cumsums
 
 
 def simulate_roi(
@@ -63,28 +63,28 @@ def simulate_roi(
         - email_cost
         - net_profit
     """
-    n = len(y_true)
-    results = []
+    ks = np.asarray(ks, dtype=float)
+    assert np.all((ks > 0) & (ks <= 1))
 
-    for k in ks:
-        uplift_k = uplift_at_k(y_true, treatment, uplift_scores, k)
-        n_targeted = int(np.floor(n * k))
+    # Sort once (same ordering as the Qini metrics); uplift@k for every k
+    # is read off the cumulative responder counts
+    t_sorted, cum_t_y1, cum_c_y1 = sorted_cumsums(y_true, treatment, uplift_scores)
+    n_targeted = np.floor(len(t_sorted) * ks).astype(np.int64)
+    uplift_k = uplift_at_k_from_cumsums(cum_t_y1, cum_c_y1, t_sorted, n_targeted)
 
-        incremental_conv = uplift_k * n_targeted
-        revenue_gain = incremental_conv * margin
-        email_cost = n_targeted * cost_email
-        net_profit = revenue_gain - email_cost
+    incremental_conv = uplift_k * n_targeted
+    revenue_gain = incremental_conv * margin
+    email_cost = n_targeted * cost_email
+    net_profit = revenue_gain - email_cost
 
-        results.append(
-            {
-                "k": k,
-                "uplift_at_k": uplift_k,
-                "n_mailed": n_targeted,
-                "incremental_conv": incremental_conv,
-                "revenue_gain": revenue_gain,
-                "email_cost": email_cost,
-                "net_profit": net_profit,
-            }
-        )
-
-    return pd.DataFrame(results)
+    return pd.DataFrame(
+        {
+            "k": ks,
+            "uplift_at_k": uplift_k,
+            "n_mailed": n_targeted,
+            "incremental_conv": incremental_conv,
+            "revenue_gain": revenue_gain,
+            "email_cost": email_cost,
+            "net_profit": net_profit,
+        }
+    )
@@ -1,12 +1,14 @@
 """
-Uplift modeling utilities using a T-learner with Random Forests.
+Uplift modeling utilities using a T-learner with histogram gradient boosting.
 
 This module implements:
-- Feature preprocessing (numeric + categorical via ColumnTransformer)
-- T-learner Random Forest with probability calibration
+- Feature preprocessing (numeric + ordinal-encoded categorical via ColumnTransformer)
+- T-learner HistGradientBoosting (native categorical splits) with optional
+  held-out probability calibration
 - Qini curve computation
 - Qini AUC calculation
 - uplift@k evaluation
+- Combined evaluation sharing one sort by uplift
 - Qini plotting utilities
 
 Used in the main pipeline for the Hillstrom uplift experiment.
@@ -15,23 +17,46 @@ Used in the main pipeline for the Hillstrom uplift experiment.
 import numpy as np
 import pandas as pd
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import OrdinalEncoder
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.calibration import CalibratedClassifierCV
 from pathlib import Path
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# scikit-learn >= 1.6 replaces cv="prefit" with FrozenEstimator
+try:
+    from sklearn.frozen import FrozenEstimator
+except ImportError:
+    FrozenEstimator = None
+
+# Numba is optional: only needed for backend="numba"
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 
 # ----------------------------------------------------------------------
 # 1. FEATURE PREPROCESSING
 # ----------------------------------------------------------------------
-def preprocess_features(df: pd.DataFrame, numeric_cols: list, categorical_cols: list):
-    """Create a ColumnTransformer for mixed feature types."""
+def preprocess_features(numeric_cols: list, categorical_cols: list):
+    """
+    Create a ColumnTransformer for mixed feature types.
+    Output columns are numeric first, then one ordinal code per categorical
+    (unseen categories map to -1, which the boosting model treats as missing).
+    """
     transformer = ColumnTransformer(
         [
             ("num", "passthrough", numeric_cols),
-            ("cat", OneHotEncoder(handle_unknown="ignore"), categorical_cols),
+            (
+                "cat",
+                OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1),
+                categorical_cols,
+            ),
         ]
     )
     return transformer
@@ -40,6 +65,42 @@ def preprocess_features(df: pd.DataFrame, numeric_cols: list, categorical_cols:
 # ----------------------------------------------------------------------
 # 2. TRAIN T-LEARNER
 # ----------------------------------------------------------------------
+def _downsample_negatives(X, y, neg_pos_ratio: float, random_state: int):
+    """Keep all positives and at most `neg_pos_ratio` negatives per positive."""
+    pos_idx = np.flatnonzero(y == 1)
+    neg_idx = np.flatnonzero(y == 0)
+    n_keep = int(neg_pos_ratio * len(pos_idx))
+    if len(pos_idx) == 0 or n_keep >= len(neg_idx):
+        return X, y
+
+    rng = np.random.default_rng(random_state)
+    keep = np.sort(np.concatenate([pos_idx, rng.choice(neg_idx, size=n_keep, replace=False)]))
+    return X[keep], y[keep]
+
+
+def _fit_calibrated(base, X, y, calib_size: float, random_state: int, neg_pos_ratio=None):
+    """
+    Fit `base` once, then isotonic-calibrate it on a held-out split.
+    Negatives are undersampled for the fit only; calibration sees the
+    untouched class prior and corrects the shift.
+    """
+    X_fit, X_cal, y_fit, y_cal = train_test_split(
+        X, y,
+        test_size=calib_size,
+        random_state=random_state,
+        stratify=y
+    )
+    if neg_pos_ratio is not None:
+        X_fit, y_fit = _downsample_negatives(X_fit, y_fit, neg_pos_ratio, random_state)
+    base.fit(X_fit, y_fit)
+
+    if FrozenEstimator is not None:
+        model = CalibratedClassifierCV(FrozenEstimator(base), method="isotonic")
+    else:
+        model = CalibratedClassifierCV(base, method="isotonic", cv="prefit")
+    return model.fit(X_cal, y_cal)
+
+
 def train_uplift_tlearner(
     df: pd.DataFrame,
     features: list,
@@ -47,19 +108,28 @@ def train_uplift_tlearner(
     random_state: int = 42,
     n_estimators: int = 200,
     max_depth: int = 6,
+    calib_size: float = 0.15,
+    neg_pos_ratio: float = 5.0,
+    calibrate: bool = False,
 ) -> pd.DataFrame:
     """
     Train uplift model using T-learner:
-    - train RF on treated subset
-    - train RF on control subset
+    - train gradient boosting on treated subset
+    - train gradient boosting on control subset
     - predict P(y|treat) - P(y|control)
+
+    Qini / uplift@k only use the ranking of the uplift, so by default each arm
+    is a single uncalibrated fit on all its rows. Set `calibrate=True` when
+    absolute probabilities matter: each model is then fit with negatives
+    undersampled to `neg_pos_ratio` per positive (None keeps all) and
+    isotonic-calibrated on a held-out `calib_size` share of its subset.
     """
     X = df[features]
     y = df["conversion"].astype(int)
     t = df["treatment"].astype(int)
 
-    # Stratify by outcome + treatment → balanced split
-    strata = (t.astype(str) + "_" + y.astype(str))
+    # Stratify by outcome + treatment → balanced split (key = 2*t + y)
+    strata = (t.values.astype(np.int8) << 1) | y.values.astype(np.int8)
 
     X_train, X_test, y_train, y_test, t_train, t_test = train_test_split(
         X, y, t,
@@ -68,34 +138,56 @@ def train_uplift_tlearner(
         stratify=strata
     )
 
-    # Auto-detect types
-    numeric_cols = [col for col in features if df[col].dtype != object]
-    categorical_cols = [col for col in features if df[col].dtype == object]
+    # Auto-detect types (single pass over the cached dtypes Series); anything
+    # non-numeric (object, pandas "str", category, ...) is categorical
+    is_numeric = X.dtypes.map(pd.api.types.is_numeric_dtype).astype(bool)
+    numeric_cols = is_numeric.index[is_numeric].tolist()
+    categorical_cols = is_numeric.index[~is_numeric].tolist()
 
     # Transform features
-    transformer = preprocess_features(df, numeric_cols, categorical_cols)
+    transformer = preprocess_features(numeric_cols, categorical_cols)
     X_train_trans = transformer.fit_transform(X_train)
     X_test_trans = transformer.transform(X_test)
 
-    # Base models
-    base_t = RandomForestClassifier(
-        n_estimators=n_estimators,
+    # Categorical columns come after the numeric ones in the transformed matrix
+    categorical_mask = np.r_[
+        np.zeros(len(numeric_cols), dtype=bool),
+        np.ones(len(categorical_cols), dtype=bool),
+    ]
+
+    # Base models (histogram binning + native categorical splits); class
+    # reweighting only when calibration will undo the prior shift
+    class_weight = "balanced" if calibrate else None
+    base_t = HistGradientBoostingClassifier(
+        max_iter=n_estimators,
         max_depth=max_depth,
+        categorical_features=categorical_mask,
+        early_stopping=True,
+        class_weight=class_weight,
         random_state=random_state,
     )
-    base_c = RandomForestClassifier(
-        n_estimators=n_estimators,
+    base_c = HistGradientBoostingClassifier(
+        max_iter=n_estimators,
         max_depth=max_depth,
+        categorical_features=categorical_mask,
+        early_stopping=True,
+        class_weight=class_weight,
         random_state=random_state,
     )
 
-    # Probability calibration
-    model_t = CalibratedClassifierCV(base_t, method="isotonic", cv=3)
-    model_c = CalibratedClassifierCV(base_c, method="isotonic", cv=3)
+    # Split rows by arm once (single mask, reused for X and y)
+    mask_t = t_train.values == 1
+    mask_c = ~mask_t
+    Xt, yt = X_train_trans[mask_t], y_train.values[mask_t]
+    Xc, yc = X_train_trans[mask_c], y_train.values[mask_c]
 
-    # Fit models separately
-    model_t.fit(X_train_trans[t_train == 1], y_train[t_train == 1])
-    model_c.fit(X_train_trans[t_train == 0], y_train[t_train == 0])
+    # Fit models separately (one model per arm)
+    if calibrate:
+        model_t = _fit_calibrated(base_t, Xt, yt, calib_size, random_state, neg_pos_ratio)
+        model_c = _fit_calibrated(base_c, Xc, yc, calib_size, random_state, neg_pos_ratio)
+    else:
+        model_t = base_t.fit(Xt, yt)
+        model_c = base_c.fit(Xc, yc)
 
     # Predict probabilities
     prob_t = model_t.predict_proba(X_test_trans)[:, 1]
@@ -115,27 +207,114 @@ def train_uplift_tlearner(
 # ----------------------------------------------------------------------
 # 3. QINI CURVE
 # ----------------------------------------------------------------------
-def qini_curve(y_true: np.ndarray, uplift_scores: np.ndarray, treatment: np.ndarray):
+def _as_arrays(y_true, treatment, uplift_scores):
+    """Contiguous int8/int8/float32 NumPy copies of metric inputs (no pandas index)."""
+    return (
+        np.ascontiguousarray(y_true, dtype=np.int8),
+        np.ascontiguousarray(treatment, dtype=np.int8),
+        np.ascontiguousarray(uplift_scores, dtype=np.float32),
+    )
+
+
+def _sort_by_uplift(y_true: np.ndarray, treatment: np.ndarray, uplift_scores: np.ndarray):
+    """Order outcomes and treatment by descending uplift with a single argsort."""
+    order = np.argsort(uplift_scores)[::-1]  # descending, no negated copy
+    return y_true[order], treatment[order]
+
+
+if HAS_NUMBA:
+    @njit(cache=True, error_model="numpy")
+    def _qini_core(y_sorted, t_sorted, N_t, N_c):
+        """Single pass over sorted data: running responder counts -> Qini."""
+        n = len(y_sorted)
+        qini = np.empty(n, dtype=np.float32)
+        inv_t, inv_c = 1.0 / N_t, 1.0 / N_c
+        ct = 0
+        cc = 0
+        for i in range(n):
+            if t_sorted[i] == 1:
+                ct += y_sorted[i]
+            else:
+                cc += y_sorted[i]
+            qini[i] = ct * inv_t - cc * inv_c
+        return qini
+
+    @njit(cache=True)
+    def _uplift_top_core(y_top, t_top):
+        """Treated minus control response rate over the top-k rows (0 if an arm is empty)."""
+        sum_t = 0
+        n_t = 0
+        sum_c = 0
+        n_c = 0
+        for i in range(len(y_top)):
+            if t_top[i] == 1:
+                sum_t += y_top[i]
+                n_t += 1
+            elif t_top[i] == 0:
+                sum_c += y_top[i]
+                n_c += 1
+        if n_t == 0 or n_c == 0:
+            return 0.0
+        return sum_t / n_t - sum_c / n_c
+
+
+def _check_backend(backend: str):
+    """Validate a metrics `backend` ("numpy" default, "numba" opt-in)."""
+    if backend not in ("numpy", "numba"):
+        raise ValueError(f"Unknown backend: {backend!r}. Use 'numpy' or 'numba'.")
+    if backend == "numba" and not HAS_NUMBA:
+        raise ImportError("backend='numba' requires Numba to be installed.")
+
+
+def _responder_cumsums(y_sorted: np.ndarray, t_sorted: np.ndarray):
+    """Exact cumulative treated / control responder counts along the sorted order."""
+    cum_t_y1 = np.cumsum(y_sorted * t_sorted, dtype=np.int64)
+    cum_c_y1 = np.cumsum(y_sorted, dtype=np.int64) - cum_t_y1  # all - treated
+    return cum_t_y1, cum_c_y1
+
+
+def sorted_cumsums(y_true, treatment, uplift_scores):
+    """
+    Sort by descending uplift once and return (t_sorted, cum_t_y1, cum_c_y1):
+    treatment in ranked order plus cumulative treated / control responders.
+    Shared by `evaluate_all` and the ROI simulation.
+    """
+    y_true, treatment, uplift_scores = _as_arrays(y_true, treatment, uplift_scores)
+    y_sorted, t_sorted = _sort_by_uplift(y_true, treatment, uplift_scores)
+    cum_t_y1, cum_c_y1 = _responder_cumsums(y_sorted, t_sorted)
+    return t_sorted, cum_t_y1, cum_c_y1
+
+
+def _qini_from_cumsums(cum_t_y1: np.ndarray, cum_c_y1: np.ndarray, N_t: int, N_c: int):
+    """Qini points (float32) from cumulative responder counts."""
+    return (
+        cum_t_y1.astype(np.float32) * np.float32(1.0 / N_t)
+        - cum_c_y1.astype(np.float32) * np.float32(1.0 / N_c)
+    )
+
+
+def qini_curve(y_true: np.ndarray, uplift_scores: np.ndarray, treatment: np.ndarray, backend: str = "numpy"):
     """
     Compute Qini curve:
     - Sort by uplift scores
     - Compute cumulative uplift difference
+    `backend="numba"` uses a fused single-pass kernel; it only pays off on very
+    large inputs once compiled, so NumPy is the default.
     """
+    _check_backend(backend)
+    y_true, treatment, uplift_scores = _as_arrays(y_true, treatment, uplift_scores)
     n = len(y_true)
-    order = np.argsort(-uplift_scores)
-
-    y_sorted = y_true[order]
-    t_sorted = treatment[order]
+    y_sorted, t_sorted = _sort_by_uplift(y_true, treatment, uplift_scores)
 
     N_t = t_sorted.sum()
     N_c = n - N_t
 
-    # cumulative number of responders
-    cum_t_y1 = np.cumsum(y_sorted * t_sorted)
-    cum_c_y1 = np.cumsum(y_sorted * (1 - t_sorted))
+    phi = np.arange(1, n + 1, dtype=np.float32) / n  # fraction of population
 
-    phi = np.arange(1, n + 1) / n  # fraction of population
-    qini = (cum_t_y1 / N_t) - (cum_c_y1 / N_c)
+    if backend == "numba":
+        qini = _qini_core(y_sorted, t_sorted, N_t, N_c)
+    else:
+        qini = _qini_from_cumsums(*_responder_cumsums(y_sorted, t_sorted), N_t, N_c)
 
     return phi, qini
 
@@ -143,16 +322,31 @@ def qini_curve(y_true: np.ndarray, uplift_scores: np.ndarray, treatment: np.ndar
 # ----------------------------------------------------------------------
 # 4. QINI AUC
 # ----------------------------------------------------------------------
-def qini_auc(phi: np.ndarray, qini: np.ndarray, treatment: np.ndarray, y_true: np.ndarray) -> float:
+def qini_auc(
+    phi: np.ndarray,
+    qini: np.ndarray,
+    treatment: np.ndarray = None,
+    y_true: np.ndarray = None,
+) -> float:
     """
     Compute normalized Qini coefficient.
+
+    `phi` must be the uniform grid 1/n, 2/n, ..., 1 returned by `qini_curve`,
+    so the trapezoid area reduces to (sum(qini) - (qini[0] + qini[-1]) / 2) / n.
+    The overall uplift `delta` is the last point of the Qini curve; pass
+    `treatment`/`y_true` only to recompute it from the raw data.
     """
-    area_model = np.trapz(qini, phi)
+    area_model = (qini.sum(dtype=np.float64) - 0.5 * (qini[0] + qini[-1])) / len(qini)
 
-    N_t = treatment.sum()
-    N_c = len(treatment) - N_t
+    if treatment is None or y_true is None:
+        delta = qini[-1]
+    else:
+        treatment = np.ascontiguousarray(treatment, dtype=np.int8)
+        y_true = np.ascontiguousarray(y_true, dtype=np.int8)
+        N_t = treatment.sum()
+        N_c = len(treatment) - N_t
+        delta = (y_true[treatment == 1].sum() / N_t) - (y_true[treatment == 0].sum() / N_c)
 
-    delta = (y_true[treatment == 1].sum() / N_t) - (y_true[treatment == 0].sum() / N_c)
     area_random = delta / 2.0
     area_perfect = delta
 
@@ -165,29 +359,66 @@ def qini_auc(phi: np.ndarray, qini: np.ndarray, treatment: np.ndarray, y_true: n
 # ----------------------------------------------------------------------
 # 5. UPLIFT @ K
 # ----------------------------------------------------------------------
-def uplift_at_k(y_true: np.ndarray, treatment: np.ndarray, uplift_scores: np.ndarray, k: float) -> float:
+def uplift_at_k(
+    y_true: np.ndarray,
+    treatment: np.ndarray,
+    uplift_scores: np.ndarray,
+    k: float,
+    backend: str = "numpy",
+) -> float:
     """
     Compute uplift@k for the top k fraction of individuals.
+    `backend="numba"` opts into a compiled single-pass reduction.
     """
     assert 0 < k <= 1
+    _check_backend(backend)
+    y_true, treatment, uplift_scores = _as_arrays(y_true, treatment, uplift_scores)
     n = len(y_true)
     top_n = int(np.floor(n * k))
     if top_n == 0:
         return 0.0
 
-    order = np.argsort(-uplift_scores)
-    idx = order[:top_n]
-
+    # Only the top_n set matters (we take means), so no full sort is needed
+    idx = np.argpartition(uplift_scores, -top_n)[-top_n:]
     y_top = y_true[idx]
     t_top = treatment[idx]
 
-    mask_t = t_top == 1
-    mask_c = t_top == 0
+    if backend == "numba":
+        return _uplift_top_core(y_top, t_top)
 
-    if mask_t.sum() == 0 or mask_c.sum() == 0:
+    # Integer accumulation: no mask-gather temporaries
+    n_t = int(t_top.sum())
+    n_c = top_n - n_t
+    if n_t == 0 or n_c == 0:
         return 0.0
 
-    return y_top[mask_t].mean() - y_top[mask_c].mean()
+    sum_t = int((y_top * t_top).sum())
+    sum_c = int(y_top.sum()) - sum_t
+    return sum_t / n_t - sum_c / n_c
+
+
+def uplift_at_k_from_cumsums(
+    cum_t_y1: np.ndarray,
+    cum_c_y1: np.ndarray,
+    t_sorted: np.ndarray,
+    top_n,
+):
+    """
+    Compute uplift@k for the `top_n` best-ranked individuals from the
+    cumulative responder counts of an uplift-sorted sample (no extra sort).
+    `top_n` may be an int (returns a float) or an array of ints (returns an
+    array); uplift is 0 where the top rows miss an arm.
+    """
+    top_n = np.asarray(top_n, dtype=np.int64)
+    last = np.maximum(top_n - 1, 0)
+
+    n_t = np.cumsum(t_sorted, dtype=np.int64)[last]
+    n_c = top_n - n_t
+    valid = (top_n > 0) & (n_t > 0) & (n_c > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uplift = np.where(valid, cum_t_y1[last] / n_t - cum_c_y1[last] / n_c, 0.0)
+
+    return float(uplift) if uplift.ndim == 0 else uplift
 
 
 # ----------------------------------------------------------------------
@@ -197,35 +428,60 @@ def plot_qini_vs_k(y_true, uplift_scores, treatment, title=None, save_path=None,
     """
     Plot Qini curve vs % population targeted.
     """
-    y_true = np.asarray(y_true)
-    uplift_scores = np.asarray(uplift_scores)
-    treatment = np.asarray(treatment)
+    y_true, treatment, uplift_scores = _as_arrays(y_true, treatment, uplift_scores)
 
     # Qini curve
     phi, qini = qini_curve(y_true, uplift_scores, treatment)
     k_pct = phi * 100.0
 
-    # Random baseline
-    p_t = y_true[treatment == 1].mean()
-    p_c = y_true[treatment == 0].mean()
-    delta = p_t - p_c
+    # Random baseline (overall uplift = end point of the Qini curve)
+    delta = qini[-1]
     qini_random = delta * phi
 
-    plt.figure()
-    plt.plot(k_pct, qini, label="Model")
-    plt.plot(k_pct, qini_random, "--", label="Random baseline")
-    plt.xlabel("k (% of customers)")
-    plt.ylabel("Qini (cumulative uplift)")
+    if show:
+        fig = plt.figure()
+    else:
+        # Off-screen figure: no pyplot registry or GUI backend involved
+        fig = Figure()
+        FigureCanvasAgg(fig)
+
+    ax = fig.subplots()
+    ax.plot(k_pct, qini, label="Model")
+    ax.plot(k_pct, qini_random, "--", label="Random baseline")
+    ax.set_xlabel("k (% of customers)")
+    ax.set_ylabel("Qini (cumulative uplift)")
     if title:
-        plt.title(title)
-    plt.legend()
+        ax.set_title(title)
+    ax.legend()
 
     # Save file
     if save_path:
         Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(save_path, dpi=150, bbox_inches="tight")
+        fig.savefig(save_path, dpi=150, bbox_inches="tight")
 
     if show:
         plt.show()
+        plt.close(fig)
+
+
+# ----------------------------------------------------------------------
+# 7. COMBINED EVALUATION
+# ----------------------------------------------------------------------
+def evaluate_all(y_true, treatment, uplift_scores, k: float):
+    """
+    Compute (phi, qini, qini AUC, uplift@k) sharing a single sort by uplift
+    and a single pass of cumulative responder counts.
+    """
+    assert 0 < k <= 1
+    t_sorted, cum_t_y1, cum_c_y1 = sorted_cumsums(y_true, treatment, uplift_scores)
+    n = len(t_sorted)
+
+    N_t = int(t_sorted.sum())
+    N_c = n - N_t
+    phi = np.arange(1, n + 1, dtype=np.float32) / n
+    qini = _qini_from_cumsums(cum_t_y1, cum_c_y1, N_t, N_c)
+
+    auc = qini_auc(phi, qini)
+    uplift_k = uplift_at_k_from_cumsums(cum_t_y1, cum_c_y1, t_sorted, int(np.floor(n * k)))
 
-    plt.close()
+    return phi, qini, auc, uplift_k